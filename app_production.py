@@ -4,20 +4,51 @@ Ready for public deployment with security features
 """
 
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from integrated_capitalizer import IntegratedCapitalizer
 import os
 import time
+import queue
+import atexit
+import threading
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from functools import wraps
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to Flask's stdlib json
+    orjson = None
 
 app = Flask(__name__)
 
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Parse requests and serialize responses with orjson"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    
+    app.json = OrjsonProvider(app)
+
 # Production config
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'change-this-in-production-please')
 app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024  # 1MB max request size
 
+# Per-endpoint body limits, checked before any JSON is parsed. Generous
+# enough for 10,000 characters of text even with every one \u-escaped.
+MAX_CHECK_BODY = 64 * 1024
+MAX_CHECK_WORD_BODY = 16 * 1024
+
+# Most texts one /api/check-batch request may hold; its body limit allows
+# each of them as much as /api/check allows one
+MAX_BATCH_TEXTS = 16
+MAX_CHECK_BATCH_BODY = MAX_BATCH_TEXTS * MAX_CHECK_BODY
+
 # Enable CORS for API routes
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -30,35 +61,104 @@ if not app.debug:
         '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
     ))
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    
+    # Log records are handed to a background thread so request handlers
+    # never block on file writes or log rotation
+    log_queue = queue.SimpleQueue()
+    log_listener = None
+    
+    def start_log_listener():
+        """Start the log writer thread (threads don't survive fork, so
+        forked workers start their own)"""
+        global log_listener
+        log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        log_listener.start()
+    
+    start_log_listener()
+    os.register_at_fork(after_in_child=start_log_listener)
+    atexit.register(lambda: log_listener.stop())
+    app.logger.addHandler(QueueHandler(log_queue))
     app.logger.setLevel(logging.INFO)
     app.logger.info('Capitalization Checker startup')
 
 # Global checker instance
 checker = None
+checker_lock = threading.Lock()
 
-# Simple rate limiting (in-memory)
-request_counts = {}
+# Cached /api/stats payload
+db_stats = None
+
+def reconnect_checker():
+    """Give a forked worker its own database connections. The checker
+    itself (rules, caches, name index) is inherited from the parent."""
+    global checker_lock
+    checker_lock = threading.Lock()
+    if checker is not None:
+        checker.geo_checker.reconnect()
+
+os.register_at_fork(after_in_child=reconnect_checker)
+
+# Simple rate limiting (in-memory token bucket)
+# Each IP maps to (tokens, last_refill_time), least recently seen first
+buckets = OrderedDict()
+buckets_lock = threading.Lock()
 RATE_LIMIT = 100  # requests per minute per IP
+MAX_TRACKED_IPS = 100000  # idle IPs beyond this are forgotten
+
+# With REDIS_URL set, limits are counted in Redis so they hold across all
+# workers and instances (fixed one-minute window per IP)
+REDIS_URL = os.environ.get('REDIS_URL')
+redis_rate_script = None
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL))
+    redis_rate_script = redis_client.register_script("""
+        local n = redis.call('INCR', KEYS[1])
+        if n == 1 then redis.call('EXPIRE', KEYS[1], 60) end
+        return n
+    """)
+
+def take_token(ip):
+    """Take a token from the in-memory bucket for an IP, if one is left"""
+    current_time = time.monotonic()
+    
+    with buckets_lock:
+        tokens, last_refill = buckets.get(ip, (RATE_LIMIT, current_time))
+        
+        # Refill RATE_LIMIT tokens per minute, up to a full bucket
+        tokens = min(RATE_LIMIT, tokens + (current_time - last_refill) * RATE_LIMIT / 60)
+        allowed = tokens >= 1
+        buckets[ip] = (tokens - 1 if allowed else tokens, current_time)
+        buckets.move_to_end(ip)
+        
+        # An evicted IP has been idle longest, so its bucket had mostly
+        # refilled anyway; it starts over with a full one
+        if len(buckets) > MAX_TRACKED_IPS:
+            buckets.popitem(last=False)
+    
+    return allowed
+
+def within_rate_limit(ip):
+    """Check the shared Redis counter, falling back to the local bucket"""
+    if redis_rate_script is not None:
+        try:
+            window = int(time.time() // 60)
+            return redis_rate_script(keys=[f'rl:{ip}:{window}']) <= RATE_LIMIT
+        except redis.RedisError as e:
+            app.logger.error(f'Redis rate limit check failed: {str(e)}')
+    
+    return take_token(ip)
 
 def rate_limit(f):
     """Rate limiting decorator"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         ip = request.remote_addr
-        current_time = time.time()
-        
-        if ip not in request_counts:
-            request_counts[ip] = []
         
-        # Remove requests older than 1 minute
-        request_counts[ip] = [t for t in request_counts[ip] if current_time - t < 60]
-        
-        if len(request_counts[ip]) >= RATE_LIMIT:
+        if not within_rate_limit(ip):
             app.logger.warning(f'Rate limit exceeded for IP: {ip}')
             return jsonify({'error': 'Rate limit exceeded. Please try again in a minute.'}), 429
         
-        request_counts[ip].append(current_time)
         return f(*args, **kwargs)
     
     return decorated_function
@@ -66,7 +166,13 @@ def rate_limit(f):
 def get_checker():
     """Lazy initialization of checker"""
     global checker
-    if checker is None:
+    if checker is not None:
+        return checker
+    
+    with checker_lock:
+        if checker is not None:
+            return checker
+        
         db_path = os.environ.get('DATABASE_PATH', 
                                  os.path.join(os.path.dirname(__file__), 'geonames.db'))
         
@@ -74,10 +180,12 @@ def get_checker():
             app.logger.error(f'Database not found at {db_path}')
             raise FileNotFoundError(f'Database not found. Please run geonames_downloader.py first.')
         
-        checker = IntegratedCapitalizer(db_path)
+        # PRELOAD_NAMES=0 queries SQLite for every name instead of holding
+        # the single-word names in memory (only used without marisa-trie)
+        preload_names = os.environ.get('PRELOAD_NAMES', '1') != '0'
+        checker = IntegratedCapitalizer(db_path, preload_names=preload_names)
         app.logger.info('Capitalization checker initialized successfully')
-    
-    return checker
+        return checker
 
 @app.route('/')
 def index():
@@ -89,9 +197,13 @@ def index():
 def check_text():
     """API endpoint to check text capitalization"""
     try:
-        data = request.get_json()
+        # Reject oversized bodies before spending time parsing them
+        if (request.content_length or 0) > MAX_CHECK_BODY:
+            return jsonify({'error': 'Request too large'}), 413
         
-        if not data:
+        data = request.get_json(silent=True)
+        
+        if not isinstance(data, dict) or not data:
             return jsonify({'error': 'No JSON data provided'}), 400
         
         text = data.get('text', '').strip()
@@ -115,14 +227,62 @@ def check_text():
         app.logger.error(f'Error in check_text: {str(e)}')
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/check-batch', methods=['POST'])
+@rate_limit
+def check_batch():
+    """API endpoint to check many texts in one request"""
+    try:
+        # Reject oversized bodies before spending time parsing them
+        if (request.content_length or 0) > MAX_CHECK_BATCH_BODY:
+            return jsonify({'error': 'Request too large'}), 413
+        
+        data = request.get_json(silent=True)
+        
+        if not isinstance(data, dict) or not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        texts = data.get('texts')
+        
+        if not isinstance(texts, list) or not texts:
+            return jsonify({'error': 'No texts provided'}), 400
+        
+        if len(texts) > MAX_BATCH_TEXTS:
+            return jsonify({'error': f'Too many texts. Maximum {MAX_BATCH_TEXTS}.'}), 400
+        
+        if not all(isinstance(text, str) and text.strip() for text in texts):
+            return jsonify({'error': 'Every text must be a non-empty string'}), 400
+        
+        texts = [text.strip() for text in texts]
+        
+        if any(len(text) > 10000 for text in texts):
+            return jsonify({'error': 'Text too long. Maximum 10,000 characters.'}), 400
+        
+        checker = get_checker()
+        results = checker.analyze_texts(texts)
+        
+        total = sum(result['total_corrections'] for result in results)
+        app.logger.info(f'Batch check completed: {len(results)} texts, {total} corrections')
+        return jsonify({'results': results})
+        
+    except FileNotFoundError as e:
+        app.logger.error(f'Database error: {str(e)}')
+        return jsonify({'error': 'Database not available'}), 503
+    except Exception as e:
+        app.logger.error(f'Error in check_batch: {str(e)}')
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/check-word', methods=['POST'])
 @rate_limit
 def check_word():
     """API endpoint to check a single word"""
     try:
-        data = request.get_json()
+        # Reject oversized bodies before spending time parsing them
+        if (request.content_length or 0) > MAX_CHECK_WORD_BODY:
+            return jsonify({'error': 'Request too large'}), 413
         
-        if not data:
+        data = request.get_json(silent=True)
+        
+        if not isinstance(data, dict) or not data:
             return jsonify({'error': 'No JSON data provided'}), 400
         
         word = data.get('word', '').strip()
@@ -151,14 +311,17 @@ def check_word():
         app.logger.error(f'Error in check_word: {str(e)}')
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    """Get database statistics"""
-    try:
-        checker = get_checker()
-        
+def get_db_stats():
+    """Database statistics, computed once (the data never changes at runtime)"""
+    global db_stats
+    if db_stats is not None:
+        return db_stats
+    
+    checker = get_checker()
+    
+    with checker.geo_checker.connection() as conn:
         # Get count of geographic names
-        cursor = checker.geo_checker.conn.cursor()
+        cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM geonames")
         geo_count = cursor.fetchone()[0]
         
@@ -169,12 +332,20 @@ def get_stats():
             GROUP BY feature_class
         """)
         feature_counts = dict(cursor.fetchall())
-        
-        return jsonify({
-            'total_geographic_names': geo_count,
-            'feature_counts': feature_counts,
-            'rule_categories': len(checker.rules)
-        })
+    
+    # Concurrent first requests may both compute this; the result is the same
+    db_stats = {
+        'total_geographic_names': geo_count,
+        'feature_counts': feature_counts,
+        'rule_categories': len(checker.rules)
+    }
+    return db_stats
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get database statistics"""
+    try:
+        return jsonify(get_db_stats())
         
     except FileNotFoundError as e:
         app.logger.error(f'Database error: {str(e)}')
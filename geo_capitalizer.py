@@ -5,12 +5,145 @@ Uses GeoNames database to check proper capitalization of geographic names
 
 import sqlite3
 import re
-from typing import Optional, Tuple, List, Dict
+import os
+import queue
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple, List, Dict, Iterable
+
+try:
+    import marisa_trie
+except ImportError:  # optional: lookups fall back to SQLite
+    marisa_trie = None
+
+# Applied to every pooled connection. The database is only ever read at
+# runtime, so these only tune reads: mmap the file and give each
+# connection a generous page cache.
+CONNECTION_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256MB
+    "PRAGMA cache_size=-65536",     # 64MB
+)
+
+# Generic terms that follow special rules
+GENERIC_TERMS = frozenset({
+    'river', 'lake', 'ocean', 'sea', 'bay', 'gulf',
+    'mountain', 'mount', 'hill', 'valley', 'peak',
+    'street', 'road', 'avenue', 'boulevard', 'drive',
+    'city', 'town', 'village',
+    'island', 'peninsula',
+    'desert', 'forest', 'park'
+})
+
+# Compass directions
+DIRECTIONS = frozenset({
+    'north', 'south', 'east', 'west',
+    'northern', 'southern', 'eastern', 'western',
+    'northeast', 'northwest', 'southeast', 'southwest',
+    'northeastern', 'northwestern', 'southeastern', 'southwestern',
+    'central', 'upper', 'lower', 'middle'
+})
+
+# SQLite's default limit on host parameters (?) per statement
+MAX_SQL_PARAMS = 999
+
+def name_index_path(db_path: str) -> str:
+    """Where the lowercase name -> correct form trie for a database lives"""
+    return os.path.splitext(db_path)[0] + '_names.marisa'
+
+
+def _lookup_names_size(count: int, limit: int) -> int:
+    """
+    Number of names a batch lookup query is built for: the next power of
+    two, so only a handful of distinct statements are ever prepared
+    """
+    return min(1 << (count - 1).bit_length(), limit)
+
+
+@lru_cache(maxsize=None)
+def _lookup_names_sql(size: int) -> str:
+    """Batch lookup query for exactly size names, bound twice"""
+    placeholders = ','.join('?' * size)
+    return f"""
+        SELECT name_lc, name, population, geonameid FROM geonames
+        WHERE name_lc IN ({placeholders})
+        UNION ALL
+        SELECT asciiname_lc, name, population, geonameid FROM geonames
+        WHERE asciiname_lc IN ({placeholders})
+    """
+
 
 class GeoCapitalizer:
-    def __init__(self, db_path: str = "geonames.db"):
+    # Potential geographic names in running text: runs of capitalized words
+    _WORD_RE = re.compile(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b')
+    
+    # Queries are kept as constant strings so SQLite's per-connection
+    # statement cache reuses their compiled form.
+    # Two lookups rather than an OR, so each can be answered from its
+    # covering index (GEONAMES_INDEXES in geonames_downloader).
+    # Every lookup path (these queries, the preloaded dict and the trie
+    # built by geonames_downloader) picks the most populous feature, and
+    # the lowest geonameid among equally populous ones, so they all agree.
+    _CORRECT_FORM_SQL = """
+        SELECT name FROM (
+            SELECT name, population, geonameid FROM geonames WHERE name_lc = ?
+            UNION ALL
+            SELECT name, population, geonameid FROM geonames WHERE asciiname_lc = ?
+        )
+        ORDER BY population DESC, geonameid
+        LIMIT 1
+    """
+    
+    _LOOKUP_NAME_SQL = """
+        SELECT geonameid, name, asciiname, feature_class, feature_code,
+               country_code, population
+        FROM geonames 
+        WHERE name_lc = ? OR asciiname_lc = ?
+        ORDER BY population DESC, geonameid
+        LIMIT 1
+    """
+    
+    # Every single-word name, least populous (then highest geonameid) first,
+    # so loading them into a dict leaves each key with its preferred feature
+    _SINGLE_WORD_NAMES_SQL = """
+        SELECT name_lc, name, population, geonameid FROM geonames
+        WHERE instr(name_lc, ' ') = 0
+        UNION ALL
+        SELECT asciiname_lc, name, population, geonameid FROM geonames
+        WHERE instr(asciiname_lc, ' ') = 0
+        ORDER BY population, geonameid DESC
+    """
+    
+    def __init__(self, db_path: str = "geonames.db", pool_size: int = 8,
+                 cache_size: int = 131072, preload_names: bool = True):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        self.pool_size = pool_size
+        
+        # Read-only connections shared by the web server's worker threads
+        self.pool = self._open_pool()
+        
+        # Memory-mapped trie of lowercase name -> correct form, built by the
+        # downloader. Skipped if it's older than the database it indexes.
+        self.names = None
+        trie_path = name_index_path(db_path)
+        if (marisa_trie is not None and os.path.exists(trie_path)
+                and os.path.getmtime(trie_path) >= os.path.getmtime(db_path)):
+            self.names = marisa_trie.BytesTrie().mmap(trie_path)
+        
+        # Without the trie, keep single-word names (the bulk of lookups) in
+        # memory as lowercase name -> correct form, and only query SQLite
+        # for multi-word names. That's roughly 150 bytes per name, in every
+        # worker process: gigabytes for the full worldwide dump, so install
+        # marisa-trie or pass preload_names=False for large databases.
+        self.single_word_names = None
+        if self.names is None and preload_names:
+            self.single_word_names = self._load_single_word_names()
+        
+        # Correct form of an already-lowercased name, or None if not found.
+        # The database doesn't change while we're running, so cached
+        # lookups never go stale; clear_cache() is only needed on reload
+        self._correct_form = lru_cache(maxsize=cache_size)(self._query_correct_form)
         
         # Feature classes in GeoNames
         self.feature_classes = {
@@ -25,70 +158,97 @@ class GeoCapitalizer:
             'V': 'Vegetation'          # forests, heaths
         }
         
-        # Generic terms that follow special rules
-        self.generic_terms = {
-            'river', 'lake', 'ocean', 'sea', 'bay', 'gulf',
-            'mountain', 'mount', 'hill', 'valley', 'peak',
-            'street', 'road', 'avenue', 'boulevard', 'drive',
-            'city', 'town', 'village',
-            'island', 'peninsula',
-            'desert', 'forest', 'park'
-        }
-        
-        # Compass directions
-        self.directions = {
-            'north', 'south', 'east', 'west',
-            'northern', 'southern', 'eastern', 'western',
-            'northeast', 'northwest', 'southeast', 'southwest',
-            'northeastern', 'northwestern', 'southeastern', 'southwestern',
-            'central', 'upper', 'lower', 'middle'
-        }
-        
+    def _connect(self) -> sqlite3.Connection:
+        """Open a read-only connection to the database"""
+        uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool for the duration of a block"""
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+    
+    @contextmanager
+    def cursor(self):
+        """
+        Borrow a pooled connection's cursor for the duration of a block.
+        Each connection keeps one cursor, so lookups don't create a new one.
+        """
+        with self.connection() as conn:
+            yield self._cursors[conn]
+    
+    def _open_pool(self) -> queue.Queue:
+        pool = queue.Queue()
+        self._cursors = {}
+        for _ in range(self.pool_size):
+            conn = self._connect()
+            self._cursors[conn] = conn.cursor()
+            pool.put(conn)
+        return pool
+    
     def close(self):
-        """Close database connection"""
-        self.conn.close()
+        """Close database connections"""
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
     
-    def lookup_name(self, name: str) -> Optional[Dict]:
+    def reconnect(self):
         """
-        Look up a geographic name in the database
-        Returns dict with name info or None if not found
+        Replace the pooled connections with fresh ones. SQLite connections
+        must not be used across fork(), so forked workers call this first.
         """
-        cursor = self.conn.cursor()
+        self.close()
+        self.pool = self._open_pool()
+    
+    def clear_cache(self):
+        """Forget cached lookups (e.g. after the database was rebuilt)"""
+        self._correct_form.cache_clear()
+        if self.single_word_names is not None:
+            self.single_word_names = self._load_single_word_names()
+    
+    def _load_single_word_names(self) -> Dict[str, str]:
+        with self.cursor() as cursor:
+            cursor.execute(self._SINGLE_WORD_NAMES_SQL)
+            return {key: name for key, name, _, _ in cursor}
+    
+    def _query_correct_form(self, name_lc: str) -> Optional[str]:
+        """Fetch just the name of the most populous feature matching a lowercase name"""
+        if self.names is not None:
+            values = self.names.get(name_lc)
+            if values:
+                return values[0].decode('utf-8')
+            return None
         
-        # Try exact match first
-        cursor.execute("""
-            SELECT geonameid, name, asciiname, feature_class, feature_code, 
-                   country_code, population
-            FROM geonames 
-            WHERE name = ? OR asciiname = ?
-            ORDER BY population DESC
-            LIMIT 1
-        """, (name, name))
+        if self.single_word_names is not None and ' ' not in name_lc:
+            return self.single_word_names.get(name_lc)
         
-        result = cursor.fetchone()
+        with self.cursor() as cursor:
+            cursor.execute(self._CORRECT_FORM_SQL, (name_lc, name_lc))
+            result = cursor.fetchone()
         
         if result:
-            return {
-                'geonameid': result[0],
-                'name': result[1],
-                'asciiname': result[2],
-                'feature_class': result[3],
-                'feature_code': result[4],
-                'country_code': result[5],
-                'population': result[6]
-            }
+            return result[0]
+        return None
+    
+    def lookup_name(self, name: str) -> Optional[Dict]:
+        """
+        Look up a geographic name in the database (case-insensitive)
+        Returns dict with name info or None if not found
         
-        # Try case-insensitive search
-        cursor.execute("""
-            SELECT geonameid, name, asciiname, feature_class, feature_code,
-                   country_code, population
-            FROM geonames 
-            WHERE LOWER(name) = LOWER(?) OR LOWER(asciiname) = LOWER(?)
-            ORDER BY population DESC
-            LIMIT 1
-        """, (name, name))
+        Checking capitalization only needs the name; use
+        get_correct_capitalization() for that, which is cached.
+        """
+        name_lc = name.lower()
         
-        result = cursor.fetchone()
+        with self.cursor() as cursor:
+            cursor.execute(self._LOOKUP_NAME_SQL, (name_lc, name_lc))
+            result = cursor.fetchone()
         
         if result:
             return {
@@ -103,32 +263,117 @@ class GeoCapitalizer:
         
         return None
     
+    def lookup_names(self, names: Iterable[str]) -> Dict[str, str]:
+        """
+        Look up many geographic names at once (case-insensitive)
+        Returns dict mapping each lowercase name found to its correct form
+        """
+        return self.lookup_names_lc({name.lower() for name in names})
+    
+    def lookup_names_lc(self, names_lc: Iterable[str]) -> Dict[str, str]:
+        """lookup_names() for names that are already lowercase"""
+        wanted = set(names_lc)
+        
+        if self.names is not None:
+            found = {}
+            for key in wanted:
+                name = self._query_correct_form(key)
+                if name is not None:
+                    found[key] = name
+            return found
+        
+        found = {}
+        if self.single_word_names is not None:
+            single_words = {key for key in wanted if ' ' not in key}
+            found = {key: self.single_word_names[key]
+                     for key in single_words if key in self.single_word_names}
+            wanted -= single_words
+        
+        keys = list(wanted)
+        best = {}
+        
+        # Each name is bound twice (name_lc and asciiname_lc)
+        chunk_size = MAX_SQL_PARAMS // 2
+        with self.cursor() as cursor:
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i:i + chunk_size]
+                # Pad to the query's size by repeating a name (harmless in IN)
+                size = _lookup_names_size(len(chunk), chunk_size)
+                chunk += chunk[:1] * (size - len(chunk))
+                cursor.execute(_lookup_names_sql(size), chunk + chunk)
+                
+                # Keep the most populous feature for each name (the
+                # lowest geonameid on a tie)
+                for key, name, population, geonameid in cursor:
+                    rank = (population, -geonameid)
+                    if key not in best or rank > best[key][1]:
+                        best[key] = (name, rank)
+        
+        found.update((key, name) for key, (name, _) in best.items())
+        return found
+    
     def is_proper_name(self, name: str) -> bool:
         """Check if a name exists in the database as a geographic feature"""
-        return self.lookup_name(name) is not None
+        return self.get_correct_capitalization(name) is not None
     
     def get_correct_capitalization(self, name: str) -> Optional[str]:
         """
         Get the correct capitalization for a geographic name
         Returns the properly capitalized name or None if not found
         """
-        info = self.lookup_name(name)
-        if info:
-            return info['name']
-        return None
+        return self._correct_form(name.lower())
     
     def check_capitalization(self, text: str) -> Tuple[bool, str]:
         """
         Check if a geographic name is properly capitalized
         Returns (is_correct, correct_form)
         """
-        correct_form = self.get_correct_capitalization(text)
+        return self.check_capitalization_lc(text.lower(), text)
+    
+    def check_capitalization_lc(self, name_lc: str, original: str) -> Tuple[bool, str]:
+        """
+        check_capitalization() for callers that already have the name
+        lowercased: name_lc is looked up, original is what gets checked
+        """
+        correct_form = self._correct_form(name_lc)
         if correct_form is None:
             return (None, None)  # Not a known geographic name
         
-        is_correct = (text == correct_form)
+        is_correct = (original == correct_form)
         return (is_correct, correct_form)
     
+    def might_contain(self, name_lc: str) -> bool:
+        """
+        Cheap pre-check for an already-lowercased name: False means it is
+        certainly not a geographic name. Without the name index or the
+        preloaded single-word names nothing can be ruled out without a
+        query, so every name might be one.
+        """
+        if self.names is not None:
+            return name_lc in self.names
+        if self.single_word_names is not None and ' ' not in name_lc:
+            return name_lc in self.single_word_names
+        return True
+    
+    def get_correct_capitalization_lc(self, name_lc: str) -> Optional[str]:
+        """get_correct_capitalization() for an already-lowercased name"""
+        return self._correct_form(name_lc)
+    
+    def check_capitalization_batch(self, names: Iterable[str]) -> Dict[str, Tuple[bool, str]]:
+        """
+        check_capitalization() for many names with one batched lookup
+        Returns dict mapping each name found to (is_correct, correct_form);
+        names that aren't geographic names are left out
+        """
+        names = list(names)  # iterated twice
+        correct_forms = self.lookup_names(names)
+        results = {}
+        for name in names:
+            correct_form = correct_forms.get(name.lower())
+            if correct_form is not None:
+                results[name] = (name == correct_form, correct_form)
+        return results
+    
     def apply_capitalization_rules(self, phrase: str) -> str:
         """
         Apply geographic capitalization rules to a phrase
@@ -141,23 +386,21 @@ class GeoCapitalizer:
             word_lower = word.lower()
             
             # Check if it's a direction/descriptor
-            if word_lower in self.directions:
+            if word_lower in DIRECTIONS:
                 # Capitalize if it's part of a well-defined region
                 if i < len(words) - 1:
-                    next_word = words[i + 1]
                     # Check if the full phrase is a known place
-                    test_phrase = ' '.join(words[i:])
-                    if self.is_proper_name(test_phrase):
-                        correct = self.get_correct_capitalization(test_phrase)
-                        if correct:
-                            return correct
+                    test_phrase = ' '.join(words[i:]).lower()
+                    correct = self._correct_form(test_phrase)
+                    if correct:
+                        return correct
                     # Otherwise keep lowercase for directions
                     result.append(word_lower)
                 else:
                     result.append(word_lower)
             
             # Check if it's a generic term
-            elif word_lower in self.generic_terms:
+            elif word_lower in GENERIC_TERMS:
                 # Check if it's part of a proper name
                 if i > 0:
                     # Generic term after a proper name (e.g., "Mississippi River")
@@ -167,7 +410,7 @@ class GeoCapitalizer:
             
             # Otherwise, look it up
             else:
-                correct = self.get_correct_capitalization(word)
+                correct = self._correct_form(word_lower)
                 if correct:
                     result.append(correct)
                 else:
@@ -176,23 +419,35 @@ class GeoCapitalizer:
         
         return ' '.join(result)
     
-    def check_text(self, text: str) -> List[Tuple[str, str, str]]:
+    def check_text(self, text: str) -> List[Tuple[str, str, int]]:
         """
         Check an entire text for geographic names and their capitalization
-        Returns list of (found_text, correct_form, location_in_text)
+        Returns list of (found_text, correct_form, offset_in_text)
+        """
+        return self.check_texts([text])[0]
+    
+    def check_texts(self, texts: List[str]) -> List[List[Tuple[str, str, int]]]:
+        """
+        Check many texts at once, resolving the candidates from all of them
+        with a single batched lookup
+        Returns one check_text() result per text, in order
         """
-        issues = []
+        # (position, word) for every candidate, grouped by text
+        candidates = [[(m.start(), m.group()) for m in self._WORD_RE.finditer(text)]
+                      for text in texts]
         
-        # Pattern to find potential geographic names (capitalized words)
-        # This is a simple approach - can be refined
-        words = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', text)
+        correct_forms = self.lookup_names([word for found in candidates for _, word in found])
         
-        for word in words:
-            is_correct, correct_form = self.check_capitalization(word)
-            if is_correct is not None and not is_correct:
-                issues.append((word, correct_form, text.find(word)))
+        results = []
+        for found in candidates:
+            issues = []
+            for position, word in found:
+                correct_form = correct_forms.get(word.lower())
+                if correct_form is not None and word != correct_form:
+                    issues.append((word, correct_form, position))
+            results.append(issues)
         
-        return issues
+        return results
     
     def get_feature_info(self, name: str) -> Optional[str]:
         """
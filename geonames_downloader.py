@@ -3,11 +3,26 @@ GeoNames Data Downloader and Database Builder
 Downloads geographic names from GeoNames.org and builds a SQLite database
 """
 
+import urllib.error
 import urllib.request
+import http.client
 import zipfile
 import os
+import io
+import csv
+import shutil
 import sqlite3
-from typing import List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import SplitResult, urljoin, urlsplit
+from typing import List, Tuple, TextIO, Optional, Set
+
+from geo_capitalizer import name_index_path
+
+try:
+    import marisa_trie
+except ImportError:  # optional: the app falls back to SQLite lookups
+    marisa_trie = None
 
 # GeoNames file format (tab-separated):
 # 0: geonameid
@@ -30,35 +45,145 @@ from typing import List, Tuple
 # 17: timezone
 # 18: modification date
 
+# Feature classes imported by default. Spots (S: buildings, farms, ...) and
+# undersea features (U) make up a large share of GeoNames but are never
+# useful for checking text, so they are skipped to keep the database small.
+DEFAULT_FEATURE_CLASSES = frozenset({'A', 'H', 'L', 'P', 'R', 'T', 'V'})
+
+# Feature classes GeoNames gives no population (rivers, mountains, parks,
+# roads, forests); min_population never filters these out
+UNPOPULATED_FEATURE_CLASSES = frozenset({'H', 'L', 'R', 'T', 'V'})
+
+# Indexes on the geonames table (dropped during bulk imports, rebuilt after).
+# The name indexes carry population and name so the checker's
+# "most populous match" lookups are answered from the index alone.
+GEONAMES_INDEXES = {
+    'idx_name_lc_pop': 'geonames(name_lc, population DESC, name)',  # case-insensitive lookups
+    'idx_asciiname_lc_pop': 'geonames(asciiname_lc, population DESC, name)',
+    'idx_feature_class': 'geonames(feature_class)',
+}
+
+# Indexes from older databases that the ones above replace
+OBSOLETE_INDEXES = ('idx_name_lc', 'idx_asciiname_lc')
+
+# Redirects followed when downloading a file
+MAX_REDIRECTS = 5
+
+# Fast, non-durable settings for building the database; a crash mid-import
+# just means re-running the downloader
+IMPORT_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    "PRAGMA journal_mode=MEMORY",
+    "PRAGMA temp_store=MEMORY",
+)
+
 class GeoNamesDownloader:
-    def __init__(self, db_path: str = "geonames.db"):
+    def __init__(self, db_path: str = "geonames.db", download_workers: int = 4,
+                 feature_classes: Optional[Set[str]] = DEFAULT_FEATURE_CLASSES,
+                 min_population: int = 0):
+        """
+        Args:
+            db_path: Path of the SQLite database to build
+            download_workers: Number of files downloaded in parallel
+            feature_classes: Feature classes to import (None imports all)
+            min_population: Skip places (and other populated features) with
+                a smaller population; unpopulated classes such as rivers
+                and mountains are always kept
+        """
         self.db_path = db_path
         self.base_url = "https://download.geonames.org/export/dump/"
+        self.download_workers = download_workers
+        self.feature_classes = feature_classes
+        self.min_population = min_population
+        
+        # One keep-alive connection per download thread and host, all
+        # tracked so close() can shut them down
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        
+    def _request(self, filename: str):
+        """
+        GET a file from GeoNames, following redirects. Direct downloads
+        reuse this thread's keep-alive connection to the host; when a proxy
+        is configured (HTTP(S)_PROXY), urllib handles the request instead.
+        """
+        url = self.base_url + filename
+        
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if (parts.scheme in urllib.request.getproxies()
+                    and not urllib.request.proxy_bypass(parts.hostname)):
+                return urllib.request.urlopen(url, timeout=60)
+            
+            response = self._get(parts)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            
+            if response.status != 200:
+                response.read()
+                raise urllib.error.HTTPError(url, response.status, response.reason,
+                                             response.headers, None)
+            return response
+        
+        raise urllib.error.HTTPError(url, response.status, 'Too many redirects',
+                                     response.headers, None)
+    
+    def _get(self, url: SplitResult) -> http.client.HTTPResponse:
+        """GET a URL over this thread's persistent connection to its host"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
         
+        path = url.path + ('?' + url.query if url.query else '')
+        for attempt in range(2):
+            conn = connections.get((url.scheme, url.netloc))
+            if conn is None:
+                connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                                    else http.client.HTTPConnection)
+                conn = connections[url.scheme, url.netloc] = connection_class(url.netloc, timeout=60)
+                with self._connections_lock:
+                    self._connections.append(conn)
+            try:
+                conn.request('GET', path)
+                return conn.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # The server dropped the idle connection; reconnect once
+                conn.close()
+                if attempt:
+                    raise
+    
+    def close(self):
+        """Close the keep-alive connections opened by downloads"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+    
     def download_file(self, filename: str, output_dir: str = "data") -> str:
         """Download a file from GeoNames"""
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
         
-        url = self.base_url + filename
         output_path = os.path.join(output_dir, filename)
         
+        # Data extracted by earlier versions of this script
         if os.path.exists(output_path.replace('.zip', '.txt')):
             print(f"{filename} already downloaded and extracted")
             return output_path.replace('.zip', '.txt')
         
+        if os.path.exists(output_path):
+            print(f"{filename} already downloaded")
+            return output_path
+        
+        # Zip files are kept compressed; the importer reads them directly
         print(f"Downloading {filename}...")
-        urllib.request.urlretrieve(url, output_path)
+        partial_path = output_path + '.part'
+        with self._request(filename) as response, open(partial_path, 'wb') as f:
+            shutil.copyfileobj(response, f, 1 << 20)
+        os.replace(partial_path, output_path)
         print(f"Downloaded to {output_path}")
         
-        if filename.endswith('.zip'):
-            print(f"Extracting {filename}...")
-            with zipfile.ZipFile(output_path, 'r') as zip_ref:
-                zip_ref.extractall(output_dir)
-            extracted_file = output_path.replace('.zip', '.txt')
-            print(f"Extracted to {extracted_file}")
-            return extracted_file
-        
         return output_path
     
     def download_feature_codes(self) -> str:
@@ -73,13 +198,18 @@ class GeoNamesDownloader:
         """
         if countries is None:
             print("Downloading all countries (this may take a while)...")
-            return [self.download_file("allCountries.zip")]
+            try:
+                return [self.download_file("allCountries.zip")]
+            finally:
+                self.close()
         
-        files = []
-        for country in countries:
-            filename = f"{country}.zip"
-            files.append(self.download_file(filename))
-        return files
+        # Downloads are network-bound, so fetch several countries at once
+        filenames = [f"{country}.zip" for country in countries]
+        try:
+            with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+                return list(pool.map(self.download_file, filenames))
+        finally:
+            self.close()
     
     def create_database(self):
         """Create SQLite database with proper schema"""
@@ -102,22 +232,20 @@ class GeoNamesDownloader:
                 admin2_code TEXT,
                 population INTEGER,
                 elevation INTEGER,
-                timezone TEXT
+                timezone TEXT,
+                name_lc TEXT,
+                asciiname_lc TEXT
             )
         """)
         
-        # Index for fast name lookups
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_name ON geonames(name)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_asciiname ON geonames(asciiname)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_feature_class ON geonames(feature_class)
-        """)
+        # Databases built before the lowercase columns existed
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(geonames)")}
+        if 'name_lc' not in columns:
+            print("Adding lowercase name columns to existing database...")
+            conn.create_function('py_lower', 1, str.lower, deterministic=True)
+            cursor.execute("ALTER TABLE geonames ADD COLUMN name_lc TEXT")
+            cursor.execute("ALTER TABLE geonames ADD COLUMN asciiname_lc TEXT")
+            cursor.execute("UPDATE geonames SET name_lc = py_lower(name), asciiname_lc = py_lower(asciiname)")
         
         # Feature codes reference table
         cursor.execute("""
@@ -130,8 +258,31 @@ class GeoNamesDownloader:
         
         conn.commit()
         conn.close()
+        self.create_indexes()
         print(f"Database created at {self.db_path}")
     
+    def create_indexes(self):
+        """Create the lookup indexes on the geonames table"""
+        conn = sqlite3.connect(self.db_path)
+        for index_name in OBSOLETE_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        for index_name, target in GEONAMES_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {target}")
+        conn.commit()
+        # The checker opens the database read-only, so gather the query
+        # planner's statistics here while we can still write
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.close()
+    
+    def drop_indexes(self):
+        """Drop the lookup indexes so bulk inserts don't have to maintain them"""
+        conn = sqlite3.connect(self.db_path)
+        for index_name in (*GEONAMES_INDEXES, *OBSOLETE_INDEXES):
+            conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        conn.commit()
+        conn.close()
+    
     def import_feature_codes(self, file_path: str):
         """Import feature codes into database"""
         conn = sqlite3.connect(self.db_path)
@@ -154,21 +305,49 @@ class GeoNamesDownloader:
         print("Feature codes imported")
     
     def import_geonames_file(self, file_path: str, batch_size: int = 10000):
-        """Import GeoNames data file into database"""
+        """Import a GeoNames data file (.txt, or the .zip it ships in) into database"""
+        print(f"Importing {file_path}...")
+        
+        if not file_path.endswith('.zip'):
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                self.import_geonames_stream(f, batch_size)
+            return
+        
+        # Read the data straight out of the archive instead of extracting it
+        member = os.path.basename(file_path).replace('.zip', '.txt')
+        with zipfile.ZipFile(file_path) as archive, archive.open(member) as raw:
+            self.import_geonames_stream(io.TextIOWrapper(raw, encoding='utf-8', newline=''),
+                                        batch_size)
+    
+    def import_geonames_stream(self, f: TextIO, batch_size: int = 10000):
+        """Import GeoNames rows from an open text stream (in a single transaction)"""
         conn = sqlite3.connect(self.db_path)
+        for pragma in IMPORT_PRAGMAS:
+            conn.execute(pragma)
         cursor = conn.cursor()
         
         batch = []
         count = 0
+        insert_sql = """
+            INSERT OR REPLACE INTO geonames 
+            (geonameid, name, asciiname, alternatenames, latitude, longitude,
+             feature_class, feature_code, country_code, admin1_code, admin2_code,
+             population, elevation, timezone, name_lc, asciiname_lc)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
         
-        print(f"Importing {file_path}...")
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                parts = line.strip().split('\t')
+        # GeoNames fields are never quoted; csv splits the lines in C.
+        # Some alternatenames fields exceed csv's default size limit, which
+        # is process-wide, so it's raised only for the duration of the import.
+        previous_limit = csv.field_size_limit(1 << 24)
+        try:
+            for parts in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
                 if len(parts) < 19:
                     continue
                 
+                if self.feature_classes is not None and parts[6] not in self.feature_classes:
+                    continue
+                
                 try:
                     record = (
                         int(parts[0]),  # geonameid
@@ -184,40 +363,73 @@ class GeoNamesDownloader:
                         parts[11],      # admin2_code
                         int(parts[14]) if parts[14] else 0,  # population
                         int(parts[15]) if parts[15] else None,  # elevation
-                        parts[17]       # timezone
+                        parts[17],      # timezone
+                        parts[1].lower(),  # name_lc
+                        parts[2].lower()   # asciiname_lc
                     )
-                    batch.append(record)
-                    count += 1
-                    
-                    if len(batch) >= batch_size:
-                        cursor.executemany("""
-                            INSERT OR REPLACE INTO geonames 
-                            (geonameid, name, asciiname, alternatenames, latitude, longitude,
-                             feature_class, feature_code, country_code, admin1_code, admin2_code,
-                             population, elevation, timezone)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, batch)
-                        conn.commit()
-                        batch = []
-                        if count % 100000 == 0:
-                            print(f"  Imported {count:,} records...")
-                
                 except (ValueError, IndexError) as e:
                     continue
+                
+                if (record[11] < self.min_population
+                        and parts[6] not in UNPOPULATED_FEATURE_CLASSES):
+                    continue
+                
+                batch.append(record)
+                count += 1
+                
+                if len(batch) >= batch_size:
+                    cursor.executemany(insert_sql, batch)
+                    batch = []
+                    if count % 100000 == 0:
+                        print(f"  Imported {count:,} records...")
+        finally:
+            csv.field_size_limit(previous_limit)
         
         if batch:
-            cursor.executemany("""
-                INSERT OR REPLACE INTO geonames 
-                (geonameid, name, asciiname, alternatenames, latitude, longitude,
-                 feature_class, feature_code, country_code, admin1_code, admin2_code,
-                 population, elevation, timezone)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, batch)
-            conn.commit()
+            cursor.executemany(insert_sql, batch)
         
+        conn.commit()
         conn.close()
         print(f"Import complete. Total records: {count:,}")
     
+    def build_name_index(self):
+        """
+        Build the lowercase name -> correct form trie the checker uses for
+        lookups, keeping the most populous feature for each name (the
+        lowest geonameid on a tie, as the checker's SQLite lookups do)
+        """
+        trie_path = name_index_path(self.db_path)
+        if marisa_trie is None:
+            print("marisa-trie not installed; skipping name index (lookups will use SQLite)")
+            # Don't leave an index from a previous build behind
+            if os.path.exists(trie_path):
+                os.remove(trie_path)
+            return
+        
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("""
+            SELECT key, name FROM (
+                SELECT name_lc AS key, name, population, geonameid FROM geonames
+                UNION ALL
+                SELECT asciiname_lc, name, population, geonameid FROM geonames
+                WHERE asciiname_lc != name_lc
+            )
+            ORDER BY key, population DESC, geonameid
+        """)
+        
+        def best_names():
+            previous = None
+            for key, name in rows:
+                if key != previous:
+                    previous = key
+                    yield key, name.encode('utf-8')
+        
+        print("Building name index...")
+        trie = marisa_trie.BytesTrie(best_names())
+        conn.close()
+        trie.save(trie_path)
+        print(f"Name index written to {trie_path} ({len(trie):,} names)")
+    
     def setup_complete_database(self, countries: List[str] = None):
         """Complete setup: download, create database, and import data"""
         # Create database
@@ -227,10 +439,14 @@ class GeoNamesDownloader:
         feature_codes_file = self.download_feature_codes()
         self.import_feature_codes(feature_codes_file)
         
-        # Download and import geographic data
+        # Download and import geographic data, building indexes once at the end
         data_files = self.download_countries_data(countries)
+        self.drop_indexes()
         for file_path in data_files:
             self.import_geonames_file(file_path)
+        print("Building indexes...")
+        self.create_indexes()
+        self.build_name_index()
         
         print("\nDatabase setup complete!")
         print(f"Database location: {os.path.abspath(self.db_path)}")
@@ -0,0 +1,28 @@
+"""
+Gunicorn configuration for production
+Usage: gunicorn -c gunicorn.conf.py app_production:app
+"""
+
+import multiprocessing
+import os
+
+# Threaded workers: each worker serves several requests at once, so a
+# request waiting on SQLite doesn't hold up the whole worker
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Load the app in the master and build the checker there (when_ready), so
+# forked workers inherit it copy-on-write instead of each building their
+# own. Workers reopen their SQLite connections after fork (see
+# reconnect_checker in app_production).
+preload_app = True
+
+def when_ready(server):
+    """Build the checker and its stats in the master before forking workers"""
+    import app_production
+    try:
+        app_production.get_checker()
+        app_production.get_db_stats()
+    except Exception as e:
+        server.log.warning(f'Checker not preloaded, workers will load it: {e}')
@@ -5,222 +5,406 @@ This merges geographic name checking with your existing capitalization rules
 
 from geo_capitalizer import GeoCapitalizer
 import re
-from typing import List, Tuple, Dict
+import string
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import List, Tuple, Dict, Iterable, Iterator, Optional
+
+# NOTE: Don't add Numba (@numba.jit) to anything in this module. The work
+# here is string handling and SQLite lookups, which CPython already hands
+# to C (str methods, re, sqlite3); Numba can only run it in object mode,
+# which is no faster and often slower (see numba/numba#2585).
+
+# Sentence boundaries, kept (captured) so the text can be rejoined exactly
+_SENT_SPLIT_RE = re.compile(r'([.!?]\s+)')
+
+# Texts with fewer sentences than this are always corrected sequentially;
+# handing them to the thread pool costs more than it saves
+MIN_PARALLEL_SENTENCES = 4
+
+# Multi-word geographic names are tried at these lengths, longest first
+NGRAM_LENGTHS = (3, 2)
+
+# Your existing capitalization rules from the app
+RULES = {
+    'days': frozenset(['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']),
+    'months': frozenset(['january', 'february', 'march', 'april', 'may', 'june', 
+                         'july', 'august', 'september', 'october', 'november', 'december']),
+    'holidays': frozenset(['christmas', 'christmas day', 'easter', 'thanksgiving', 'halloween', 
+                           'valentine', 'independence day', 'new year']),
+    'languages': frozenset(['english', 'spanish', 'french', 'german', 'italian', 
+                            'chinese', 'japanese', 'russian', 'arabic']),
+    'military_ranks': frozenset(['captain', 'colonel', 'general', 'lieutenant', 
+                                 'sergeant', 'major', 'admiral', 'commander']),
+    'titles': frozenset(['president', 'senator', 'governor', 'mayor', 'doctor', 
+                         'professor', 'judge', 'reverend']),
+    'religions': frozenset(['christianity', 'islam', 'judaism', 'buddhism', 'hinduism']),
+    'deities': frozenset(['god', 'allah', 'buddha', 'jesus', 'christ'])
+}
+
+# Terms that should NOT be capitalized
+LOWERCASE_TERMS = {
+    'seasons': frozenset(['spring', 'summer', 'fall', 'autumn', 'winter']),
+    'directions': frozenset(['north', 'south', 'east', 'west', 'northern', 'southern', 
+                             'eastern', 'western']) # When used directionally, not as region names
+}
+
+# Category of every single word any rule cares about (including the words
+# of multi-word holidays), so check_word finds the rule that applies with
+# one lookup and stops early on all other words. Whole holidays are keys
+# too, so check_word("new year") is still recognized.
+_WORD_TO_CATEGORY = {
+    word: category
+    for category, terms in list(RULES.items()) + list(LOWERCASE_TERMS.items())
+    for term in terms
+    for word in term.split()
+}
+_WORD_TO_CATEGORY.update((holiday, 'holidays') for holiday in RULES['holidays'])
+
+# Correct form of every capitalized rule word (the words of multi-word
+# holidays are capitalized individually) and of every whole holiday.
+# Lowercase terms need no entry: their correct form is the lowercased word.
+_CANONICAL = {
+    word: word.capitalize()
+    for terms in RULES.values()
+    for term in terms
+    for word in term.split()
+}
+_CANONICAL.update((holiday, ' '.join(word.capitalize() for word in holiday.split()))
+                  for holiday in RULES['holidays'])
+
+# Every holiday, longest first so "christmas day" is preferred over
+# "christmas"; finds the holidays a piece of text mentions in a single pass
+_HOLIDAY_RE = re.compile(
+    r'\b(?:' + '|'.join(r'\s+'.join(re.escape(word) for word in holiday.split())
+                        for holiday in sorted(RULES['holidays'], key=len, reverse=True)) + r')\b',
+    re.IGNORECASE)
+
+# Reason reported for corrections made by each capitalization rule
+CATEGORY_REASONS = {
+    'days': "Day of week",
+    'months': "Month",
+    'holidays': "Holiday",
+    'languages': "Language",
+    'military_ranks': "Military rank",
+    'titles': "Title",
+    'religions': "Religion",
+    'deities': "Deity",
+}
+
+# Words, as found by str.split(), but with their offsets
+_WORD_RE = re.compile(r'\S+')
+
+
+def tokenize(text: str) -> List[Tuple[int, str]]:
+    """Split text into (offset, word) pairs"""
+    return [(match.start(), match.group()) for match in _WORD_RE.finditer(text)]
+
+
+def _ngrams(words: List[str]) -> Dict[Tuple[int, int], str]:
+    """Every multi-word candidate in a list of words, keyed by (position, length)"""
+    return {(i, k): ' '.join(words[i:i+k])
+            for i in range(len(words)) for k in NGRAM_LENGTHS if i + k <= len(words)}
+
+
+def _next_is_upper(tokens: List[Tuple[int, str]], index: int) -> bool:
+    """Whether the word after tokens[index] is capitalized"""
+    return index + 1 < len(tokens) and tokens[index + 1][1][0].isupper()
+
 
 class IntegratedCapitalizer:
     """
     Combines GeoNames geographic database with your existing capitalization rules
     """
     
-    def __init__(self, geonames_db_path: str = "geonames.db"):
+    def __init__(self, geonames_db_path: str = "geonames.db", sentence_workers: int = 0,
+                 preload_names: bool = True):
         """
         Initialize with both systems
         
         Args:
             geonames_db_path: Path to GeoNames SQLite database
+            sentence_workers: Threads used to correct the sentences of long
+                texts in parallel (0 = one at a time). Only helps when
+                lookups go to SQLite, which releases the GIL.
+            preload_names: Without the name trie, keep single-word names
+                in memory (see GeoCapitalizer)
         """
-        self.geo_checker = GeoCapitalizer(geonames_db_path)
-        
-        # Your existing capitalization rules from the app
-        self.rules = {
-            'days': ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'],
-            'months': ['january', 'february', 'march', 'april', 'may', 'june', 
-                      'july', 'august', 'september', 'october', 'november', 'december'],
-            'holidays': ['christmas', 'easter', 'thanksgiving', 'halloween', 
-                        'valentine', 'independence day', 'new year'],
-            'languages': ['english', 'spanish', 'french', 'german', 'italian', 
-                         'chinese', 'japanese', 'russian', 'arabic'],
-            'military_ranks': ['captain', 'colonel', 'general', 'lieutenant', 
-                              'sergeant', 'major', 'admiral', 'commander'],
-            'titles': ['president', 'senator', 'governor', 'mayor', 'doctor', 
-                      'professor', 'judge', 'reverend'],
-            'religions': ['christianity', 'islam', 'judaism', 'buddhism', 'hinduism'],
-            'deities': ['god', 'allah', 'buddha', 'jesus', 'christ']
-        }
+        self.geo_checker = GeoCapitalizer(geonames_db_path, preload_names=preload_names)
         
-        # Terms that should NOT be capitalized
-        self.lowercase_terms = {
-            'seasons': ['spring', 'summer', 'fall', 'autumn', 'winter'],
-            'directions': ['north', 'south', 'east', 'west', 'northern', 'southern', 
-                          'eastern', 'western'] # When used directionally, not as region names
-        }
+        # Threads are only started on first use, so this is safe to build
+        # before forking
+        self._executor = None
+        if sentence_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=sentence_workers)
+        
+        # Rule tables are shared module-level constants
+        self.rules = RULES
+        self.lowercase_terms = LOWERCASE_TERMS
+        
+        # Words repeat a lot in real text; results depend only on the word
+        # and two context flags, so they can be cached
+        self._check_word_cached = lru_cache(maxsize=8192)(self._check_word)
+    
+    def _holiday_positions(self, text: str, tokens: List[Tuple[int, str]]) -> set:
+        """
+        Positions of the tokens that make up the holidays mentioned in text,
+        e.g. both words of "independence day" but not a "day" elsewhere
+        """
+        starts = [start for start, _ in tokens]
+        positions = set()
+        for match in _HOLIDAY_RE.finditer(text):
+            # From the token the match starts in to the last one it reaches
+            first = bisect_right(starts, match.start()) - 1
+            last = bisect_left(starts, match.end()) - 1
+            positions.update(range(first, last + 1))
+        return positions
+    
+    def _check_token(self, word: str, next_is_upper: bool,
+                     in_holiday: bool) -> Tuple[bool, str, str]:
+        """
+        Cached word check for a token in a phrase. A token that is part of
+        a holiday is checked without its surrounding punctuation
+        ("year!" in "new year!"), which is put back on the correction.
+        """
+        if not in_holiday:
+            return self._check_word_cached(word, next_is_upper, False)
+        
+        core = word.strip(string.punctuation)
+        if not core or core == word:
+            return self._check_word_cached(word, next_is_upper, True)
+        
+        prefix = word[:word.index(core)]
+        suffix = word[len(prefix) + len(core):]
+        needs_correction, correct_form, reason = self._check_word_cached(core, next_is_upper, True)
+        return (needs_correction, prefix + correct_form + suffix, reason)
     
-    def check_word(self, word: str, context: str = "") -> Tuple[bool, str, str]:
+    def check_word(self, word: str, context: str = "",
+                   index: Optional[int] = None) -> Tuple[bool, str, str]:
         """
         Check a single word using all available rules
         
         Args:
             word: The word to check
             context: Surrounding text for context (e.g., "north america" vs "went north")
+            index: Which word of the context this is, if known; otherwise
+                its first occurrence in the context is used
         
         Returns:
             (needs_correction, correct_form, reason)
         """
+        tokens = tokenize(context)
+        if index is None:
+            index = next((i for i, (_, token) in enumerate(tokens) if token == word), None)
+        
+        # The only things the rules need from the context
+        next_is_upper = index is not None and _next_is_upper(tokens, index)
+        in_holiday = index in self._holiday_positions(context, tokens)
+        
+        return self._check_token(word, next_is_upper, in_holiday)
+    
+    def _check_word(self, word: str, next_is_upper: bool,
+                    in_holiday: bool) -> Tuple[bool, str, str]:
+        """
+        check_word() with the context reduced to two flags, so results can
+        be cached: whether the next word is capitalized, and whether the
+        word is part of a holiday mentioned in the context
+        """
         word_lower = word.lower()
         
+        # Most words are neither places nor covered by a rule; skip them
+        # without a lookup (this also keeps them out of the name cache)
+        category = _WORD_TO_CATEGORY.get(word_lower)
+        if category is None and not self.geo_checker.might_contain(word_lower):
+            return (False, word, "Correct")
+        
+        geo_form = self.geo_checker.get_correct_capitalization_lc(word_lower)
+        
         # Priority 1: Check if it's a geographic name
-        geo_result = self.geo_checker.check_capitalization(word)
-        if geo_result[0] is not None:  # Found in geographic database
-            is_correct, correct_form = geo_result
-            if not is_correct:
-                return (True, correct_form, "Geographic name")
+        if geo_form is not None:  # Found in geographic database
+            if word != geo_form:
+                return (True, geo_form, "Geographic name")
+            return (False, word, "Correct")
+        
+        if category is None:
             return (False, word, "Correct")
         
-        # Priority 2: Days of the week
-        if word_lower in self.rules['days']:
-            correct = word_lower.capitalize()
-            if word != correct:
-                return (True, correct, "Day of week")
-        
-        # Priority 3: Months
-        if word_lower in self.rules['months']:
-            correct = word_lower.capitalize()
-            if word != correct:
-                return (True, correct, "Month")
-        
-        # Priority 4: Holidays
-        for holiday in self.rules['holidays']:
-            if word_lower == holiday or holiday in context.lower():
-                correct = word_lower.title()
-                if word != correct:
-                    return (True, correct, "Holiday")
-        
-        # Priority 5: Languages
-        if word_lower in self.rules['languages']:
-            correct = word_lower.capitalize()
-            if word != correct:
-                return (True, correct, "Language")
-        
-        # Priority 6: Check for titles before names
-        # This requires context to determine if followed by a proper name
-        if word_lower in self.rules['military_ranks'] or word_lower in self.rules['titles']:
-            # Check if followed by a capitalized word (likely a name)
-            context_words = context.split()
-            try:
-                word_index = context_words.index(word)
-                if word_index + 1 < len(context_words):
-                    next_word = context_words[word_index + 1]
-                    if next_word[0].isupper():  # Followed by capitalized word (name)
-                        correct = word_lower.capitalize()
-                        if word != correct:
-                            category = "Military rank" if word_lower in self.rules['military_ranks'] else "Title"
-                            return (True, correct, f"{category} before name")
-            except ValueError:
-                pass
-        
-        # Priority 7: Religions
-        if word_lower in self.rules['religions']:
-            correct = word_lower.capitalize()
-            if word != correct:
-                return (True, correct, "Religion")
-        
-        # Priority 8: Deities (special handling - often capitalized)
-        if word_lower in self.rules['deities']:
-            # "God" when referring to monotheistic deity should be capitalized
-            if word_lower in ['god', 'allah', 'jesus', 'christ', 'buddha']:
-                correct = word_lower.capitalize()
-                if word != correct:
-                    return (True, correct, "Deity")
-        
-        # Check lowercase exceptions
         # Seasons should be lowercase
-        if word_lower in self.lowercase_terms['seasons']:
+        if category == 'seasons':
             if word != word_lower:
                 return (True, word_lower, "Season (lowercase)")
+            return (False, word, "Correct")
         
         # Directions - only lowercase if used directionally, not as region name
-        if word_lower in self.lowercase_terms['directions']:
+        if category == 'directions':
             # This is tricky - would need more context
             # For now, if it's lowercase in original, leave it
-            pass
+            return (False, word, "Correct")
+        
+        # The words of multi-word holidays only count within that holiday
+        if category == 'holidays' and not (word_lower in RULES['holidays'] or in_holiday):
+            return (False, word, "Correct")
         
+        # Titles and ranks are only capitalized before a name, i.e. when
+        # followed by a capitalized word
+        if category in ('military_ranks', 'titles'):
+            if not next_is_upper:
+                return (False, word, "Correct")
+            reason = f"{CATEGORY_REASONS[category]} before name"
+        else:
+            reason = CATEGORY_REASONS[category]
+        
+        correct = _CANONICAL[word_lower]
+        if word != correct:
+            return (True, correct, reason)
         return (False, word, "Correct")
     
-    def check_phrase(self, phrase: str) -> List[Dict]:
+    def check_phrase(self, phrase: str) -> Tuple[List[Tuple[int, str]], List[Dict]]:
         """
         Check an entire phrase for capitalization issues
         
-        Returns list of corrections needed
+        Returns:
+            (tokens, corrections): the phrase's (offset, word) tokens, so
+            callers can apply corrections without splitting it again, and
+            the corrections needed, in word order. Corrections never
+            overlap: words inside a corrected multi-word name aren't
+            checked again.
         """
-        corrections = []
-        words = phrase.split()
+        tokens = tokenize(phrase)
+        return tokens, list(self._iter_corrections(phrase, tokens))
+    
+    def _iter_corrections(self, phrase: str, tokens: List[Tuple[int, str]],
+                          correct_forms: Optional[Dict[str, str]] = None) -> Iterator[Dict]:
+        """Yield the corrections check_phrase() reports, as they are found.
+        correct_forms, if given, already holds this phrase's multi-word
+        names (see analyze_texts())."""
+        words = [token for _, token in tokens]
+        covered_until = 0  # words before this are part of a corrected name
+        
+        # Build every multi-word candidate once, keyed by (position, length),
+        # as (original, lowercase) and resolve the distinct lowercase ones
+        # with one batched lookup
+        ngrams = {key: (ngram, ngram.lower()) for key, ngram in _ngrams(words).items()}
+        if correct_forms is None:
+            correct_forms = self.geo_checker.lookup_names_lc(
+                {ngram_lower for _, ngram_lower in ngrams.values()})
+        
+        # Holidays are found once per phrase, not once per word
+        holiday_positions = self._holiday_positions(phrase, tokens)
         
         # First, try to find multi-word geographic names
         for i in range(len(words)):
+            if i < covered_until:
+                continue
+            
             # Try 3-word combinations
-            if i + 2 < len(words):
-                three_word = ' '.join(words[i:i+3])
-                geo_result = self.geo_checker.check_capitalization(three_word)
-                if geo_result[0] is not None:
-                    is_correct, correct_form = geo_result
-                    if not is_correct:
-                        corrections.append({
-                            'position': i,
-                            'original': three_word,
-                            'correct': correct_form,
-                            'reason': 'Geographic name (3 words)'
-                        })
-                        continue
+            if (i, 3) in ngrams:
+                three_word, three_word_lower = ngrams[i, 3]
+                correct_form = correct_forms.get(three_word_lower)
+                if correct_form is not None and three_word != correct_form:
+                    yield {
+                        'position': i,
+                        'original': three_word,
+                        'correct': correct_form,
+                        'reason': 'Geographic name (3 words)'
+                    }
+                    covered_until = i + 3
+                    continue
             
             # Try 2-word combinations
-            if i + 1 < len(words):
-                two_word = ' '.join(words[i:i+2])
-                geo_result = self.geo_checker.check_capitalization(two_word)
-                if geo_result[0] is not None:
-                    is_correct, correct_form = geo_result
-                    if not is_correct:
-                        corrections.append({
-                            'position': i,
-                            'original': two_word,
-                            'correct': correct_form,
-                            'reason': 'Geographic name (2 words)'
-                        })
-                        continue
+            if (i, 2) in ngrams:
+                two_word, two_word_lower = ngrams[i, 2]
+                correct_form = correct_forms.get(two_word_lower)
+                if correct_form is not None and two_word != correct_form:
+                    yield {
+                        'position': i,
+                        'original': two_word,
+                        'correct': correct_form,
+                        'reason': 'Geographic name (2 words)'
+                    }
+                    covered_until = i + 2
+                    continue
             
             # Check individual word
             word = words[i]
-            needs_correction, correct_form, reason = self.check_word(word, phrase)
+            next_is_upper = _next_is_upper(tokens, i)
+            needs_correction, correct_form, reason = self._check_token(
+                word, next_is_upper, i in holiday_positions)
             if needs_correction:
-                corrections.append({
+                yield {
                     'position': i,
                     'original': word,
                     'correct': correct_form,
                     'reason': reason
-                })
-        
-        return corrections
+                }
     
-    def correct_text(self, text: str) -> Tuple[str, List[Dict]]:
+    def correct_text(self, text: str, stats: Optional[Dict[str, int]] = None,
+                     correct_forms: Optional[Dict[str, str]] = None) -> Tuple[str, List[Dict]]:
         """
         Correct all capitalization in a text
         
+        Args:
+            text: The text to correct
+            stats: If given, counts of changes by reason are added to it
+            correct_forms: If given, the text's multi-word geographic names,
+                already looked up (see analyze_texts())
+        
         Returns:
             (corrected_text, list_of_changes)
         """
         changes = []
-        sentences = re.split(r'([.!?]\s+)', text)
+        sentences = _SENT_SPLIT_RE.split(text)
         corrected_sentences = []
         
-        for sentence in sentences:
-            if not sentence.strip():
-                corrected_sentences.append(sentence)
-                continue
-            
-            corrections = self.check_phrase(sentence)
-            corrected = sentence
-            
-            # Apply corrections (in reverse order to maintain positions)
-            for correction in sorted(corrections, key=lambda x: x['position'], reverse=True):
-                words = corrected.split()
-                words[correction['position']] = correction['correct']
-                corrected = ' '.join(words)
-                changes.append(correction)
-            
+        # Sentences are independent, so long texts can be spread over the
+        # thread pool; map() still returns results in sentence order
+        correct_sentence = partial(self._correct_sentence, correct_forms=correct_forms)
+        if self._executor is not None and len(sentences) >= MIN_PARALLEL_SENTENCES:
+            results = self._executor.map(correct_sentence, sentences)
+        else:
+            results = map(correct_sentence, sentences)
+        
+        for corrected, corrections in results:
             corrected_sentences.append(corrected)
+            for correction in corrections:
+                changes.append(correction)
+                if stats is not None:
+                    reason = correction['reason']
+                    stats[reason] = stats.get(reason, 0) + 1
         
         final_text = ''.join(corrected_sentences)
         return final_text, changes
     
+    def _correct_sentence(self, sentence: str,
+                          correct_forms: Optional[Dict[str, str]] = None) -> Tuple[str, List[Dict]]:
+        """Correct one sentence, returning (corrected_sentence, corrections)"""
+        if not sentence.strip():
+            return sentence, []
+        
+        tokens = tokenize(sentence)
+        
+        # Splice each correction over the words it covers, as it is found,
+        # keeping the sentence's original spacing (corrections are in order
+        # and never overlap)
+        corrections = []
+        pieces = []
+        last_end = 0
+        for correction in self._iter_corrections(sentence, tokens, correct_forms):
+            corrections.append(correction)
+            first = correction['position']
+            last = first + correction['original'].count(' ')
+            start = tokens[first][0]
+            pieces.append(sentence[last_end:start])
+            pieces.append(correction['correct'])
+            last_end = tokens[last][0] + len(tokens[last][1])
+        
+        if not corrections:
+            return sentence, corrections
+        pieces.append(sentence[last_end:])
+        
+        return ''.join(pieces), corrections
+    
     def analyze_text(self, text: str) -> Dict:
         """
         Analyze text and return detailed report
@@ -231,13 +415,32 @@ class IntegratedCapitalizer:
         - changes (list)
         - stats (counts by category)
         """
-        corrected_text, changes = self.correct_text(text)
+        return self._analyze_text(text)
+    
+    def analyze_texts(self, texts: Iterable[str]) -> List[Dict]:
+        """
+        Analyze many texts at once, resolving the multi-word geographic
+        names in all of them with a single batched lookup
         
-        # Count changes by category
+        Returns one analyze_text() report per text, in order
+        """
+        texts = list(texts)  # iterated twice
+        
+        candidates = set()
+        for text in texts:
+            for sentence in _SENT_SPLIT_RE.split(text):
+                words = [word.lower() for _, word in tokenize(sentence)]
+                candidates.update(_ngrams(words).values())
+        correct_forms = self.geo_checker.lookup_names_lc(candidates)
+        
+        return [self._analyze_text(text, correct_forms) for text in texts]
+    
+    def _analyze_text(self, text: str,
+                      correct_forms: Optional[Dict[str, str]] = None) -> Dict:
+        """Build the analyze_text() report for one text"""
+        # Changes are counted by category as they're made
         stats = {}
-        for change in changes:
-            reason = change['reason']
-            stats[reason] = stats.get(reason, 0) + 1
+        corrected_text, changes = self.correct_text(text, stats, correct_forms)
         
         return {
             'original_text': text,
@@ -247,8 +450,16 @@ class IntegratedCapitalizer:
             'total_corrections': len(changes)
         }
     
+    def clear_cache(self):
+        """Forget cached word checks and geographic lookups"""
+        self._check_word_cached.cache_clear()
+        self.geo_checker.clear_cache()
+    
     def close(self):
-        """Close database connections"""
+        """Close database connections (and the sentence thread pool, if used)"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
         self.geo_checker.close()
 
 
@@ -0,0 +1,75 @@
+"""
+Shared fixtures: a tiny GeoNames database built with the real downloader
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_capitalizer
+from geonames_downloader import GeoNamesDownloader
+from integrated_capitalizer import IntegratedCapitalizer
+
+# (geonameid, name, asciiname, feature_class, population)
+PLACES = [
+    (1, 'New York', 'New York', 'P', 8000000),
+    (2, 'Paris', 'Paris', 'P', 2100000),
+    (3, 'Mississippi River', 'Mississippi River', 'H', 0),
+    (4, 'Mount Everest', 'Mount Everest', 'T', 0),
+    (5, 'Atlantic Ocean', 'Atlantic Ocean', 'H', 0),
+    (6, 'Los Angeles', 'Los Angeles', 'P', 3900000),
+    (7, 'York', 'York', 'P', 150000),
+    (8, 'São Paulo', 'Sao Paulo', 'P', 12000000),
+    (9, 'Paris', 'Paris', 'P', 25000),
+    (10, 'Asia', 'Asia', 'L', 0),
+    (11, 'Europe', 'Europe', 'L', 0),
+    (12, 'North America', 'North America', 'L', 0),
+    (13, 'Himalayas', 'Himalayas', 'T', 0),
+    (14, 'Empire State Building', 'Empire State Building', 'S', 0),
+    (15, 'Smith', 'Smith', 'P', 10),
+    (16, 'Salt Lake City', 'Salt Lake City', 'P', 200000),
+    # Equally populous features spelled differently: the lowest geonameid wins
+    (17, 'McAllen', 'McAllen', 'P', 140000),
+    (18, 'Mcallen', 'Mcallen', 'P', 140000),
+    (19, 'La Crosse', 'La Crosse', 'P', 50000),
+    (20, 'La crosse', 'La crosse', 'P', 50000),
+]
+
+
+def write_geonames_file(path, places):
+    """Write places as a GeoNames dump (tab-separated, 19 columns)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for geonameid, name, asciiname, feature_class, population in places:
+            fields = [str(geonameid), name, asciiname, '', '1.0', '2.0', feature_class,
+                      'PPL', 'US', '', 'CA', '', '', '', str(population), '', '',
+                      'America/New_York', '2020-01-01']
+            f.write('\t'.join(fields) + '\n')
+
+
+@pytest.fixture(scope='session')
+def db_path(tmp_path_factory):
+    """Path to a GeoNames database holding PLACES, with its name trie"""
+    directory = tmp_path_factory.mktemp('geonames')
+    data_path = str(directory / 'XX.txt')
+    write_geonames_file(data_path, PLACES)
+    
+    path = str(directory / 'geonames.db')
+    downloader = GeoNamesDownloader(path)
+    downloader.create_database()
+    downloader.import_geonames_file(data_path)
+    downloader.create_indexes()
+    downloader.build_name_index()
+    return path
+
+
+@pytest.fixture(params=['trie', 'sqlite'])
+def checker(request, db_path, monkeypatch):
+    """IntegratedCapitalizer using the name trie, or SQLite without it"""
+    if request.param == 'sqlite':
+        monkeypatch.setattr(geo_capitalizer, 'marisa_trie', None)
+    checker = IntegratedCapitalizer(db_path)
+    yield checker
+    checker.close()
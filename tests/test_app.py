@@ -0,0 +1,121 @@
+"""
+Tests for the Flask API's request validation and rate limiting
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def app_module(db_path, tmp_path, monkeypatch):
+    # The app writes logs/ relative to the working directory on import
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_PATH', db_path)
+    import app_production
+    
+    monkeypatch.setattr(app_production, 'checker', None)
+    monkeypatch.setattr(app_production, 'db_stats', None)
+    app_production.buckets.clear()
+    yield app_production
+    app_production.buckets.clear()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_check_corrects_text(client):
+    response = client.post('/api/check', json={'text': 'I visited new york on monday.'})
+    assert response.status_code == 200
+    assert response.get_json()['corrected_text'] == 'I visited New York on monday.'
+
+
+def test_check_batch(client):
+    response = client.post('/api/check-batch', json={'texts': ['in paris', 'new york']})
+    assert response.status_code == 200
+    assert [result['corrected_text'] for result in response.get_json()['results']] == [
+        'in Paris', 'New York']
+
+
+@pytest.mark.parametrize('body', [
+    {'texts': 'paris'},
+    {'texts': []},
+    {'texts': ['paris', 3]},
+    {'texts': ['paris', '  ']},
+    {'texts': ['x' * 10001]},
+])
+def test_check_batch_rejects_bad_bodies(client, body):
+    assert client.post('/api/check-batch', json=body).status_code == 400
+
+
+def test_check_batch_limits(client, app_module):
+    too_many = ['paris'] * (app_module.MAX_BATCH_TEXTS + 1)
+    assert client.post('/api/check-batch', json={'texts': too_many}).status_code == 400
+    
+    # A full batch of the longest texts fits even with every character escaped
+    texts = ['ж' * 10000] * app_module.MAX_BATCH_TEXTS
+    body = json.dumps({'texts': texts})
+    response = client.post('/api/check-batch', data=body, content_type='application/json')
+    assert response.status_code == 200
+
+
+def test_check_word(client):
+    response = client.post('/api/check-word', json={'word': 'paris', 'context': 'in paris'})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'word': 'paris', 'needs_correction': True,
+        'correct_form': 'Paris', 'reason': 'Geographic name'}
+
+
+
+@pytest.mark.parametrize('word, correct_form', [
+    ('new year', 'New Year'),
+    ('independence day', 'Independence Day'),
+])
+def test_check_word_multi_word_holiday(client, word, correct_form):
+    response = client.post('/api/check-word', json={'word': word})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'word': word, 'needs_correction': True,
+        'correct_form': correct_form, 'reason': 'Holiday'}
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'data': 'not json', 'content_type': 'application/json'},
+    {'json': [1, 2]},
+    {'json': {}},
+    {'json': {'text': ''}},
+])
+def test_check_rejects_bad_bodies(client, kwargs):
+    assert client.post('/api/check', **kwargs).status_code == 400
+
+
+def test_check_word_rejects_missing_word(client):
+    assert client.post('/api/check-word', json={'context': 'x'}).status_code == 400
+
+
+def test_oversized_bodies_are_rejected_before_parsing(client, app_module):
+    text = 'x' * (app_module.MAX_CHECK_BODY + 1)
+    assert client.post('/api/check', json={'text': text}).status_code == 413
+    
+    word = 'x' * (app_module.MAX_CHECK_WORD_BODY + 1)
+    assert client.post('/api/check-word', json={'word': word}).status_code == 413
+    
+    texts = ['x' * app_module.MAX_CHECK_BATCH_BODY]
+    assert client.post('/api/check-batch', json={'texts': texts}).status_code == 413
+
+
+def test_rate_limit(client, app_module):
+    codes = [client.post('/api/check-word', json={'word': 'paris'}).status_code
+             for _ in range(app_module.RATE_LIMIT + 5)]
+    assert codes.count(200) == app_module.RATE_LIMIT
+    assert codes[-1] == 429
+
+
+def test_stats(client):
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    # Spots (S) aren't imported by default
+    assert response.get_json()['total_geographic_names'] == 19
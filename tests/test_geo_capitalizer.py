@@ -0,0 +1,38 @@
+"""
+Tests for GeoCapitalizer lookups
+"""
+
+import pytest
+
+import geo_capitalizer
+from geo_capitalizer import GeoCapitalizer
+
+
+@pytest.fixture(params=['trie', 'preloaded', 'sqlite'])
+def geo(request, db_path, monkeypatch):
+    """GeoCapitalizer using each of its lookup paths"""
+    if request.param != 'trie':
+        monkeypatch.setattr(geo_capitalizer, 'marisa_trie', None)
+    geo = GeoCapitalizer(db_path, preload_names=request.param == 'preloaded')
+    yield geo
+    geo.close()
+
+
+def test_check_capitalization_batch_accepts_a_generator(geo):
+    names = ['paris', 'New York', 'nowhere']
+    assert geo.check_capitalization_batch(name for name in names) == {
+        'paris': (False, 'Paris'),
+        'New York': (True, 'New York'),
+    }
+
+
+def test_ascii_names_map_to_the_real_name(geo):
+    assert geo.get_correct_capitalization('sao paulo') == 'São Paulo'
+    assert geo.lookup_names(['SAO PAULO', 'salt lake city']) == {
+        'sao paulo': 'São Paulo', 'salt lake city': 'Salt Lake City'}
+
+
+def test_ties_go_to_the_lowest_geonameid(geo):
+    assert geo.get_correct_capitalization('MCALLEN') == 'McAllen'
+    assert geo.lookup_names(['mcallen', 'la crosse']) == {
+        'mcallen': 'McAllen', 'la crosse': 'La Crosse'}
@@ -0,0 +1,118 @@
+"""
+Tests for importing GeoNames dumps
+"""
+
+import csv
+import http.server
+import os
+import sqlite3
+import threading
+import urllib.error
+
+import pytest
+
+from conftest import PLACES, write_geonames_file
+from geonames_downloader import GeoNamesDownloader
+
+
+def imported_names(db_path):
+    conn = sqlite3.connect(db_path)
+    names = {row[0] for row in conn.execute("SELECT name FROM geonames")}
+    conn.close()
+    return names
+
+
+def build(tmp_path, **kwargs):
+    data_path = str(tmp_path / 'XX.txt')
+    write_geonames_file(data_path, PLACES)
+    db_path = str(tmp_path / 'geonames.db')
+    downloader = GeoNamesDownloader(db_path, **kwargs)
+    downloader.create_database()
+    downloader.import_geonames_file(data_path)
+    return db_path
+
+
+def test_spots_are_skipped_by_default(tmp_path):
+    names = imported_names(build(tmp_path))
+    assert 'Paris' in names
+    assert 'Empire State Building' not in names
+
+
+def test_min_population_keeps_unpopulated_features(tmp_path):
+    names = imported_names(build(tmp_path, min_population=1000))
+    # Small places are dropped...
+    assert 'Smith' not in names
+    assert 'New York' in names
+    # ...but rivers, mountains and regions (population 0) are not
+    assert {'Mississippi River', 'Mount Everest', 'Asia', 'North America'} <= names
+
+
+def test_import_restores_the_csv_field_size_limit(tmp_path):
+    limit = csv.field_size_limit()
+    build(tmp_path)
+    assert csv.field_size_limit() == limit
+
+
+@pytest.fixture
+def file_server(monkeypatch):
+    """
+    Local HTTP server: /files/<name> serves a file, /dump/<name> redirects
+    to it, and /loop/<name> redirects forever
+    """
+    for name in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        monkeypatch.delenv(name, raising=False)
+    
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        
+        def do_GET(self):
+            if self.path.startswith('/dump/'):
+                self.send_response(302)
+                self.send_header('Location', '/files/' + self.path[len('/dump/'):])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif self.path.startswith('/loop/'):
+                self.send_response(301)
+                self.send_header('Location', self.path)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif self.path == '/files/XX.zip':
+                body = b'zip contents'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(404)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_follows_redirects(tmp_path, file_server):
+    downloader = GeoNamesDownloader(str(tmp_path / 'geonames.db'))
+    downloader.base_url = file_server + '/dump/'
+    try:
+        path = downloader.download_file('XX.zip', str(tmp_path / 'data'))
+    finally:
+        downloader.close()
+    with open(path, 'rb') as f:
+        assert f.read() == b'zip contents'
+
+
+@pytest.mark.parametrize('prefix', ['/files/', '/loop/'])
+def test_download_errors_leave_no_file(tmp_path, file_server, prefix):
+    downloader = GeoNamesDownloader(str(tmp_path / 'geonames.db'))
+    downloader.base_url = file_server + prefix
+    with pytest.raises(urllib.error.HTTPError):
+        downloader.download_file('YY.zip' if prefix == '/files/' else 'XX.zip',
+                                 str(tmp_path / 'data'))
+    downloader.close()
+    assert not os.listdir(tmp_path / 'data')
@@ -0,0 +1,127 @@
+"""
+Tests for IntegratedCapitalizer.correct_text and friends
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("I visited new york on monday.", "I visited New York on monday."),
+    ("He speaks english and spanish fluently.", "He speaks English and Spanish fluently."),
+    ("The meeting is next wednesday in los angeles.",
+     "The meeting is next Wednesday in los angeles."),
+    ("Mount everest is in the himalayas, which are in asia.",
+     "Mount Everest is in the himalayas, which are in asia."),
+    ("The atlantic ocean borders north america and europe.",
+     "The Atlantic Ocean borders North America and europe."),
+    ("We flew to sao paulo today", "We flew to São Paulo today"),
+    ("salt lake city is big", "Salt Lake City is big"),
+])
+def test_correct_text(checker, text, expected):
+    corrected, _ = checker.correct_text(text)
+    assert corrected == expected
+
+
+def test_multi_word_name_is_not_rechecked_word_by_word(checker):
+    # "new york" must not also produce a correction for "york"
+    corrected, changes = checker.correct_text("I love new york")
+    assert corrected == "I love New York"
+    assert [(c['position'], c['original'], c['correct']) for c in changes] == [
+        (2, 'new york', 'New York')]
+
+
+def test_duplicate_words_are_all_corrected(checker):
+    corrected, changes = checker.correct_text("paris, then paris and paris again")
+    assert corrected == "paris, then Paris and Paris again"
+    assert [c['position'] for c in changes] == [2, 4]
+
+
+def test_original_spacing_is_kept(checker):
+    text = "We went to  paris.  Then\tparis  again"
+    corrected, _ = checker.correct_text(text)
+    assert corrected == "We went to  Paris.  Then\tParis  again"
+
+
+def test_text_without_corrections_is_unchanged(checker):
+    text = "Nothing  to\tfix here.  Really!"
+    assert checker.correct_text(text) == (text, [])
+
+
+def test_titles_are_capitalized_only_before_a_name(checker):
+    corrected, changes = checker.correct_text(
+        "The captain said captain Smith and the president left")
+    assert corrected == "The captain said Captain Smith and the president left"
+    assert [c['reason'] for c in changes] == ['Military rank before name']
+
+
+def test_holidays(checker):
+    corrected, _ = checker.correct_text("We celebrate christmas and easter every year.")
+    assert corrected == "We celebrate Christmas and Easter every year."
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Only the words of the holiday itself are capitalized
+    ("Happy new year, I bought a new car", "Happy New Year, I bought a new car"),
+    ("On independence day the day was hot", "On Independence Day the day was hot"),
+    # Punctuation attached to a holiday's last word doesn't stop it
+    ("happy new year!", "happy New Year!"),
+    ("christmas day.", "Christmas Day."),
+    ("in spring we had christmas", "in spring we had Christmas"),
+])
+def test_holiday_words_only_inside_the_holiday(checker, text, expected):
+    corrected, _ = checker.correct_text(text)
+    assert corrected == expected
+
+
+def test_check_word_holiday_context(checker):
+    context = "a day on independence day"
+    assert checker.check_word('day', context) == (False, 'day', 'Correct')
+    assert checker.check_word('day', context, index=4) == (True, 'Day', 'Holiday')
+
+
+def test_eastern_is_not_easter(checker):
+    corrected, _ = checker.correct_text("we drove the eastern roads")
+    assert corrected == "we drove the eastern roads"
+
+
+def test_seasons_are_lowercased(checker):
+    corrected, _ = checker.correct_text("See you in Summer")
+    assert corrected == "See you in summer"
+
+
+def test_check_word_uses_the_given_occurrence(checker):
+    context = "the captain left, then captain Smith came"
+    assert checker.check_word('captain', context) == (False, 'captain', 'Correct')
+    assert checker.check_word('captain', context, index=4) == (
+        True, 'Captain', 'Military rank before name')
+
+
+def test_analyze_text_counts_changes_by_reason(checker):
+    result = checker.analyze_text("paris and new york on monday. english too")
+    assert result['total_corrections'] == 4
+    assert result['stats'] == {
+        'Geographic name': 1,
+        'Geographic name (2 words)': 1,
+        'Day of week': 1,
+        'Language': 1,
+    }
+
+
+def test_analyze_texts_matches_analyze_text(checker):
+    texts = ["paris and new york on monday. english too",
+             "the mississippi river. happy new year!",
+             "nothing to fix here"]
+    assert checker.analyze_texts(iter(texts)) == [checker.analyze_text(t) for t in texts]
+
+
+def test_sentence_workers_give_the_same_result(db_path):
+    from integrated_capitalizer import IntegratedCapitalizer
+    
+    text = "we saw paris. then new york. on monday. in english. bye"
+    sequential = IntegratedCapitalizer(db_path)
+    threaded = IntegratedCapitalizer(db_path, sentence_workers=4)
+    try:
+        assert threaded.correct_text(text) == sequential.correct_text(text)
+    finally:
+        sequential.close()
+        threaded.close()